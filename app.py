@@ -1,9 +1,27 @@
 import streamlit as st
 import os
 from generator import EileenChangGenerator
+from novel_database import NovelDatabase
+from dedup_index import MinHashIndex
+from session_store import ChapterCache, DraftSession, session_memory_bytes
 
 st.set_page_config(page_title="张爱玲风格小说生成器", page_icon="📖", layout="wide")
 
+# Shared across all sessions: drafts live in the database, session state only holds their ID
+@st.cache_resource
+def get_database():
+    return NovelDatabase(dedup_index=MinHashIndex())
+
+@st.cache_resource
+def get_chapter_cache():
+    return ChapterCache()
+
+@st.cache_resource
+def get_generator(api_key):
+    return EileenChangGenerator(api_key=api_key)
+
+draft = DraftSession(st.session_state, get_database(), get_chapter_cache())
+
 st.title("📖 张爱玲风格小说生成器")
 st.markdown("""
 > “生命是一袭华美的袍，爬满了虱子。”
@@ -19,9 +37,29 @@ with st.sidebar:
         st.warning("请输入 API Key 或设置 GEMINI_API_KEY 环境变量")
         st.stop()
     
-    generator = EileenChangGenerator(api_key=api_key)
+    generator = get_generator(api_key)
+    
+    st.header("草稿")
+    draft_id = st.number_input("打开草稿 ID", min_value=1, value=draft.novel_id or 1)
+    if st.button("打开草稿"):
+        if draft.db.get_plot_outline(draft_id) is None:
+            st.error(f"草稿 {draft_id} 不存在")
+        elif draft.db.is_archived(draft_id):
+            # Archived novels are read-only, so edits to them would be lost
+            st.error(f"草稿 {draft_id} 已归档，无法编辑")
+        else:
+            st.session_state['novel_id'] = draft_id
+    if draft.novel_id:
+        st.caption(f"当前草稿 ID：{draft.novel_id}")
+    
+    cache_stats = draft.cache.stats()
+    st.caption(
+        f"会话内存：{session_memory_bytes(st.session_state) / 1024:.1f} KB ｜ "
+        f"共享缓存：{cache_stats['entries']} 项，{cache_stats['chars']} 字，命中率 {cache_stats['hit_rate']:.0%}"
+    )
 
 st.header("1. 构思情节")
+title = st.text_input("标题", value="未命名")
 col1, col2 = st.columns(2)
 with col1:
     theme = st.text_input("主题 (例如：错过的爱情，家族的衰落)", value="旧上海的爱恨情仇")
@@ -32,15 +70,18 @@ if st.button("生成情节大纲"):
     with st.spinner("正在构思中..."):
         try:
             plot = generator.generate_plot(theme, setting)
-            st.session_state['plot'] = plot
+            draft.start(title, theme, setting, plot)
             st.success("情节大纲生成完毕")
         except Exception as e:
             st.error(f"生成失败: {e}")
 
-if 'plot' in st.session_state:
+if draft.novel_id:
     st.subheader("情节大纲")
-    plot_text = st.text_area("编辑大纲", value=st.session_state['plot'], height=300)
-    st.session_state['plot'] = plot_text
+    plot_text = st.text_area("编辑大纲", value=draft.plot(), height=300)
+    try:
+        draft.set_plot(plot_text)
+    except ValueError as e:
+        st.error(f"保存失败: {e}")
 
     st.header("2. 撰写正文")
     chapter_num = st.number_input("章节号", min_value=1, value=1)
@@ -48,19 +89,20 @@ if 'plot' in st.session_state:
     if st.button(f"生成第 {chapter_num} 章"):
         with st.spinner("正在以此去..."):
             try:
-                chapter_content = generator.generate_chapter(st.session_state['plot'], chapter_num)
-                st.session_state[f'chapter_{chapter_num}'] = chapter_content
+                chapter_content = generator.generate_chapter(draft.plot(), chapter_num)
+                draft.save_chapter(chapter_num, chapter_content)
                 st.success("章节生成完毕")
             except Exception as e:
                 st.error(f"生成失败: {e}")
 
-    if f'chapter_{chapter_num}' in st.session_state:
+    chapter_content = draft.chapter(chapter_num)
+    if chapter_content is not None:
         st.subheader(f"第 {chapter_num} 章")
-        st.markdown(st.session_state[f'chapter_{chapter_num}'])
+        st.markdown(chapter_content)
         
         if st.button("润色本章"):
              with st.spinner("正在润色..."):
-                polished = generator.polish_text(st.session_state[f'chapter_{chapter_num}'])
-                st.session_state[f'chapter_{chapter_num}'] = polished
+                polished = generator.polish_text(chapter_content)
+                draft.save_chapter(chapter_num, polished)
                 st.experimental_rerun()
 
@@ -0,0 +1,224 @@
+import random
+import re
+import sqlite3
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import tracing
+
+
+class NearDuplicateError(Exception):
+    """Raised by DuplicateGuard when a streamed text is a near-duplicate of stored text."""
+
+    def __init__(self, matches: List[Dict]):
+        self.matches = matches
+        best = matches[0]
+        super().__init__(
+            f"near-duplicate of {best['kind']} {best['ref_id']} (novel {best['novel_id']}, "
+            f"similarity {best['similarity']:.2f})"
+        )
+
+
+class MinHashIndex:
+    """
+    MinHash/LSH index over character shingles, stored next to the novels in SQLite.
+
+    Every indexed text gets a MinHash signature; the signature is split into
+    bands and each band is hashed into a bucket. Texts sharing any bucket are
+    candidates, and candidates are ranked by estimated Jaccard similarity.
+    With the defaults (64 hashes, 16 bands of 4) pairs above ~0.5 similarity
+    are found with high probability.
+
+    Indexed kinds: "outline" (plot outlines), "chapter" (full chapters) and
+    "opening" (the first `opening_chars` characters of each chapter).
+    """
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 5,
+                 opening_chars: int = 300, seed: int = 1943):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.opening_chars = opening_chars
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(num_perm)]
+
+    def init_tables(self, conn: sqlite3.Connection):
+        """Create the signature and bucket tables."""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS minhash_signatures (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                ref_id INTEGER NOT NULL,
+                novel_id INTEGER,
+                signature BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS minhash_buckets (
+                bucket INTEGER NOT NULL,
+                signature_id INTEGER NOT NULL,
+                FOREIGN KEY (signature_id) REFERENCES minhash_signatures(id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_minhash_buckets ON minhash_buckets (bucket)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_minhash_buckets_signature ON minhash_buckets (signature_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_minhash_ref ON minhash_signatures (kind, ref_id)")
+
+    def shingles(self, text: str) -> set:
+        """Character k-grams of the text with whitespace removed."""
+        text = re.sub(r"\s+", "", text)
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text} if text else set()
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    def signature(self, text: str) -> Optional[array]:
+        """
+        MinHash signature of the text's shingles, or None for empty or whitespace-only text.
+        
+        Such texts have no shingles, and any two of them would otherwise look identical,
+        so they are never indexed or matched.
+        """
+        with tracing.span("dedup.signature", chars=len(text)):
+            hashes = [zlib.crc32(s.encode('utf-8')) for s in self.shingles(text)]
+            if not hashes:
+                return None
+            prime = self._PRIME
+            return array('Q', [min((a * h + b) % prime for h in hashes) for a, b in self._perms])
+    
+    def chapter_signatures(self, content: str) -> Tuple[Optional[array], Optional[array]]:
+        """Signatures of a chapter and of its opening, for add_chapter()."""
+        return self.signature(content), self.signature(content[:self.opening_chars])
+
+    def _buckets(self, sig: array) -> List[int]:
+        # One integer per band: band index in the high bits, band hash in the low 32
+        rows = self.rows
+        return [(band << 32) | zlib.crc32(sig[band * rows:(band + 1) * rows].tobytes())
+                for band in range(self.bands)]
+
+    def similarity(self, sig_a: array, sig_b: array) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / self.num_perm
+
+    def add(self, conn: sqlite3.Connection, kind: str, ref_id: int, novel_id: Optional[int], sig: Optional[array]):
+        """
+        Index a signature from signature(); None (empty text) is skipped. The caller commits.
+        
+        Hashing takes tens of milliseconds per chapter, so callers compute
+        signatures before their first write and only hold the lock for the inserts.
+        """
+        if sig is None:
+            return
+        with tracing.span("dedup.add", kind=kind):
+            cursor = conn.execute("""
+                INSERT INTO minhash_signatures (kind, ref_id, novel_id, signature)
+                VALUES (?, ?, ?, ?)
+            """, (kind, ref_id, novel_id, sig.tobytes()))
+            signature_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO minhash_buckets (bucket, signature_id) VALUES (?, ?)",
+                [(bucket, signature_id) for bucket in self._buckets(sig)]
+            )
+
+    def remove(self, conn: sqlite3.Connection, kinds: List[str], ref_ids: List[int]):
+        """Drop the entries of the given kinds for the given ref IDs. The caller commits."""
+        for kind in kinds:
+            for ref_id in ref_ids:
+                ids = [row[0] for row in conn.execute(
+                    "SELECT id FROM minhash_signatures WHERE kind = ? AND ref_id = ?", (kind, ref_id)
+                )]
+                for signature_id in ids:
+                    conn.execute("DELETE FROM minhash_buckets WHERE signature_id = ?", (signature_id,))
+                    conn.execute("DELETE FROM minhash_signatures WHERE id = ?", (signature_id,))
+
+    def add_chapter(self, conn: sqlite3.Connection, chapter_id: int, novel_id: int, sigs: Tuple[array, array]):
+        """Index a chapter and its opening from chapter_signatures()."""
+        self.add(conn, "chapter", chapter_id, novel_id, sigs[0])
+        self.add(conn, "opening", chapter_id, novel_id, sigs[1])
+
+    def query(self, conn: sqlite3.Connection, text: str, kind: Optional[str] = None,
+              threshold: float = 0.5, limit: int = 10) -> List[Dict]:
+        """Return indexed texts similar to `text`, most similar first."""
+        with tracing.span("dedup.query", kind=kind, chars=len(text)) as span:
+            sig = self.signature(text)
+            if sig is None:
+                return []
+            buckets = self._buckets(sig)
+            placeholders = ",".join("?" * len(buckets))
+            sql = f"""
+                SELECT DISTINCT s.id, s.kind, s.ref_id, s.novel_id, s.signature
+                FROM minhash_buckets b
+                JOIN minhash_signatures s ON s.id = b.signature_id
+                WHERE b.bucket IN ({placeholders})
+            """
+            params = list(buckets)
+            if kind:
+                sql += " AND s.kind = ?"
+                params.append(kind)
+
+            matches = []
+            candidates = 0
+            for _, row_kind, ref_id, novel_id, blob in conn.execute(sql, params):
+                candidates += 1
+                score = self.similarity(sig, array('Q', blob))
+                if score >= threshold:
+                    matches.append({
+                        'kind': row_kind,
+                        'ref_id': ref_id,
+                        'novel_id': novel_id,
+                        'similarity': score,
+                    })
+            span.set_attribute("candidates", candidates)
+
+        matches.sort(key=lambda m: m['similarity'], reverse=True)
+        return matches[:limit]
+
+
+class DuplicateGuard:
+    """
+    Watches a streamed chapter and aborts it early if its opening is a near-duplicate.
+
+    Once `opening_chars` characters have arrived, the prefix is compared with
+    the openings of stored chapters. On a match the stream is closed (so the
+    provider stops generating) and NearDuplicateError is raised.
+    """
+
+    def __init__(self, db, threshold: float = 0.6, max_attempts: int = 3):
+        if db.dedup_index is None:
+            raise ValueError("DuplicateGuard needs a NovelDatabase with a dedup_index")
+        self.db = db
+        self.threshold = threshold
+        self.max_attempts = max_attempts
+
+    def watch(self, stream: Iterator[str]) -> Iterator[str]:
+        """Pass deltas through, raising NearDuplicateError once the opening matches."""
+        opening_chars = self.db.dedup_index.opening_chars
+        prefix = []
+        prefix_len = 0
+        checked = False
+        try:
+            for delta in stream:
+                if not checked:
+                    prefix.append(delta)
+                    prefix_len += len(delta)
+                    if prefix_len >= opening_chars:
+                        checked = True
+                        self._check("".join(prefix)[:opening_chars])
+                yield delta
+            if not checked and prefix:
+                self._check("".join(prefix))
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+    def _check(self, opening: str):
+        matches = self.db.find_similar(opening, kind="opening", threshold=self.threshold, limit=3)
+        if matches:
+            raise NearDuplicateError(matches)
@@ -1,11 +1,15 @@
 import os
-from typing import Optional
+import time
+from typing import Iterator, Optional
 from corpus_manager import CorpusManager
+from dedup_index import NearDuplicateError
+import tracing
 
 class EileenChangGenerator:
     """
     Multi-provider Eileen Chang style novel generator.
     Supports: DeepSeek (free), Qwen (free), Gemini
+    Also provides an offline "fake" provider for demos and load tests.
     """
     
     def __init__(self, provider: str = "groq", api_key: Optional[str] = None):
@@ -13,15 +17,18 @@ class EileenChangGenerator:
         Initialize generator with specified provider.
         
         Args:
-            provider: "groq", "deepseek", "qwen", or "gemini"
+            provider: "groq", "deepseek", "qwen", "gemini", or "fake"
             api_key: API key (optional, will check environment variables)
         """
         self.provider = provider.lower()
         
         # Initialize corpus manager
-        self.corpus_manager = CorpusManager()
-        self.corpus_manager.download_corpus()
-        self.corpus_manager.load_corpus()
+        with tracing.span("corpus.load") as span:
+            self.corpus_manager = CorpusManager()
+            self.corpus_manager.download_corpus()
+            self.corpus_manager.load_corpus()
+            span.set_attribute("files", len(self.corpus_manager.texts))
+            span.set_attribute("chars", sum(len(t) for t in self.corpus_manager.texts))
         
         # Initialize the appropriate client
         if self.provider == "groq":
@@ -32,8 +39,10 @@ class EileenChangGenerator:
             self._init_qwen(api_key)
         elif self.provider == "gemini":
             self._init_gemini(api_key)
+        elif self.provider == "fake":
+            self._init_fake()
         else:
-            raise ValueError(f"Unsupported provider: {provider}. Use 'groq', 'deepseek', 'qwen', or 'gemini'")
+            raise ValueError(f"Unsupported provider: {provider}. Use 'groq', 'deepseek', 'qwen', 'gemini', or 'fake'")
     
     def _init_groq(self, api_key: Optional[str]):
         """Initialize Groq client (OpenAI-compatible, very fast)."""
@@ -94,6 +103,14 @@ class EileenChangGenerator:
         self.model_name = "gemini-1.5-pro"
         print(f"✓ Initialized Gemini (model: {self.model_name})")
     
+    def _init_fake(self):
+        """Initialize the offline fake backend (no API key, no network)."""
+        # Seconds to sleep per streamed chunk, to mimic network latency
+        self.fake_latency = float(os.environ.get("FAKE_LLM_LATENCY", "0.01"))
+        self.fake_chunks = int(os.environ.get("FAKE_LLM_CHUNKS", "8"))
+        self.model_name = "fake-llm"
+        print(f"✓ Initialized Fake LLM (latency: {self.fake_latency}s/chunk)")
+    
     def _generate_with_openai_compatible(self, prompt: str) -> str:
         """Generate text using OpenAI-compatible API (DeepSeek/Qwen)."""
         response = self.client.chat.completions.create(
@@ -105,13 +122,102 @@ class EileenChangGenerator:
             temperature=0.8,
             max_tokens=2000
         )
+        if response.usage:
+            span = tracing.current_span()
+            span.set_attribute("prompt_tokens", response.usage.prompt_tokens)
+            span.set_attribute("completion_tokens", response.usage.completion_tokens)
         return response.choices[0].message.content
     
     def _generate_with_gemini(self, prompt: str) -> str:
         """Generate text using Gemini API."""
         response = self.model.generate_content(prompt)
+        self._record_gemini_usage(tracing.current_span(), response)
         return response.text
     
+    @staticmethod
+    def _record_gemini_usage(span, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            span.set_attribute("prompt_tokens", usage.prompt_token_count)
+            span.set_attribute("completion_tokens", usage.candidates_token_count)
+    
+    def _stream_with_openai_compatible(self, prompt: str, span) -> Iterator[str]:
+        """Stream text deltas using OpenAI-compatible API, recording token usage on `span`."""
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是一位精通张爱玲文学风格的作家。"},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.8,
+            max_tokens=2000,
+            stream=True,
+            # Usage arrives in a final chunk with no choices
+            stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    span.set_attribute("prompt_tokens", chunk.usage.prompt_tokens)
+                    span.set_attribute("completion_tokens", chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing early (e.g. a duplicate guard abort) stops the provider generating
+            stream.close()
+    
+    def _stream_with_gemini(self, prompt: str, span) -> Iterator[str]:
+        """Stream text deltas using Gemini API, recording token usage on `span`."""
+        for chunk in self.model.generate_content(prompt, stream=True):
+            # Each chunk carries the running totals
+            self._record_gemini_usage(span, chunk)
+            if chunk.text:
+                yield chunk.text
+    
+    def _stream_with_fake(self, prompt: str) -> Iterator[str]:
+        """Stream corpus snippets from the fake backend."""
+        for _ in range(self.fake_chunks):
+            if self.fake_latency:
+                time.sleep(self.fake_latency)
+            yield self.corpus_manager.get_random_snippet(length=60)
+    
+    def _generate(self, prompt: str) -> str:
+        """Generate a full completion with the configured provider."""
+        with tracing.span("llm.call", provider=self.provider, model=self.model_name, prompt_chars=len(prompt)) as span:
+            if self.provider == "gemini":
+                text = self._generate_with_gemini(prompt)
+            elif self.provider == "fake":
+                text = "".join(self._stream_with_fake(prompt))
+            else:
+                text = self._generate_with_openai_compatible(prompt)
+            span.set_attribute("output_chars", len(text))
+            return text
+    
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """Stream a completion with the configured provider."""
+        # The span stays open across yields, so it must not become the current span
+        span = tracing.start_span("llm.stream", provider=self.provider, model=self.model_name, prompt_chars=len(prompt))
+        if self.provider == "gemini":
+            stream = self._stream_with_gemini(prompt, span)
+        elif self.provider == "fake":
+            stream = self._stream_with_fake(prompt)
+        else:
+            stream = self._stream_with_openai_compatible(prompt, span)
+        
+        chunks = 0
+        chars = 0
+        try:
+            for delta in stream:
+                if chunks == 0:
+                    span.set_attribute("first_chunk_ms", round(span.duration_ms, 3))
+                chunks += 1
+                chars += len(delta)
+                yield delta
+        finally:
+            span.set_attribute("chunks", chunks)
+            span.set_attribute("output_chars", chars)
+            span.end()
+    
     def generate_plot(self, theme: str, setting: str) -> str:
         """Generate plot outline."""
         prompt = f"""请模仿张爱玲的风格，构思一个短篇小说的情节大纲。
@@ -125,14 +231,12 @@ class EileenChangGenerator:
 3. 请提供主要人物介绍和故事起承转合的梗概。
 """
         
-        if self.provider == "gemini":
-            return self._generate_with_gemini(prompt)
-        else:
-            return self._generate_with_openai_compatible(prompt)
+        return self._generate(prompt)
     
-    def generate_chapter(self, plot_outline: str, chapter_number: int, previous_context: str = "") -> str:
-        """Generate a chapter."""
-        style_reference = self.corpus_manager.get_random_snippet(length=300)
+    def _build_chapter_prompt(self, plot_outline: str, chapter_number: int, previous_context: str) -> str:
+        """Build the chapter prompt with a random corpus style reference."""
+        with tracing.span("prompt.build", chapter_number=chapter_number):
+            style_reference = self.corpus_manager.get_random_snippet(length=300)
         
         prompt = f"""请根据以下情节大纲，模仿张爱玲的笔触撰写第 {chapter_number} 章。
 
@@ -154,11 +258,34 @@ class EileenChangGenerator:
 
 请开始撰写：
 """
+        return prompt
+    
+    def generate_chapter(self, plot_outline: str, chapter_number: int, previous_context: str = "", guard=None) -> str:
+        """
+        Generate a chapter.
         
-        if self.provider == "gemini":
-            return self._generate_with_gemini(prompt)
-        else:
-            return self._generate_with_openai_compatible(prompt)
+        Args:
+            guard: optional DuplicateGuard; the chapter is streamed and regenerated
+                   if its opening is a near-duplicate of a stored chapter
+        """
+        if guard is None:
+            prompt = self._build_chapter_prompt(plot_outline, chapter_number, previous_context)
+            return self._generate(prompt)
+        
+        for attempt in range(1, guard.max_attempts + 1):
+            stream = self.generate_chapter_stream(plot_outline, chapter_number, previous_context)
+            if attempt == guard.max_attempts:
+                # Out of retries: keep whatever comes back
+                return "".join(stream)
+            try:
+                return "".join(guard.watch(stream))
+            except NearDuplicateError as e:
+                print(f"⚠️  第 {chapter_number} 章开头与已有内容重复 ({e})，重新生成 ({attempt}/{guard.max_attempts})")
+    
+    def generate_chapter_stream(self, plot_outline: str, chapter_number: int, previous_context: str = "") -> Iterator[str]:
+        """Generate a chapter, yielding text deltas as they arrive."""
+        prompt = self._build_chapter_prompt(plot_outline, chapter_number, previous_context)
+        return self._stream(prompt)
     
     def polish_text(self, text: str) -> str:
         """Polish text to match Eileen Chang's style."""
@@ -168,10 +295,7 @@ class EileenChangGenerator:
 {text}
 """
         
-        if self.provider == "gemini":
-            return self._generate_with_gemini(prompt)
-        else:
-            return self._generate_with_openai_compatible(prompt)
+        return self._generate(prompt)
 
 if __name__ == "__main__":
     # Test with DeepSeek (free)
@@ -1,12 +1,13 @@
 from datetime import datetime
 from typing import Dict, List
+import tracing
 
 class HTMLGenerator:
     """Generates HTML output for novels."""
     
     @staticmethod
-    def generate_novel_html(novel_data: Dict, output_path: str):
-        """Generate a complete HTML file for a novel."""
+    def render_novel_html(novel_data: Dict) -> str:
+        """Render a complete HTML page for a novel and return it as a string."""
         
         html = f"""<!DOCTYPE html>
 <html lang="zh-CN">
@@ -174,8 +175,17 @@ class HTMLGenerator:
 </body>
 </html>"""
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
+        return html
+    
+    @staticmethod
+    def generate_novel_html(novel_data: Dict, output_path: str):
+        """Generate a complete HTML file for a novel."""
+        with tracing.span("render", chapters=len(novel_data['chapters'])) as span:
+            html = HTMLGenerator.render_novel_html(novel_data)
+            
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            span.set_attribute("chars", len(html))
         
         print(f"HTML generated: {output_path}")
 
@@ -0,0 +1,233 @@
+import html
+import json
+import os
+import re
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from novel_database import NovelDatabase
+import tracing
+
+
+class LibraryExporter:
+    """
+    Streams the novel library out of the database.
+
+    Novels and chapters are read through cursors one row at a time, so
+    memory stays flat no matter how large novels.db grows. Every export
+    can be limited to novels changed since a timestamp.
+    """
+
+    # Chapters buffered per Parquet row group
+    PARQUET_BATCH_SIZE = 256
+
+    def __init__(self, db: NovelDatabase, output_dir: str = "exports"):
+        self.db = db
+        self.output_dir = output_dir
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+
+    def export_jsonl(self, filename: str = "library.jsonl", since: Optional[str] = None) -> int:
+        """
+        Write one JSON line per novel followed by one line per chapter.
+
+        Lines carry a "type" of "novel" or "chapter". Returns the number of novels exported.
+        """
+        path = os.path.join(self.output_dir, filename)
+        count = 0
+        with tracing.span("export", format="jsonl") as span, open(path, 'w', encoding='utf-8') as f:
+            for novel in self.db.iter_novels(since):
+                f.write(json.dumps({'type': 'novel', **novel}, ensure_ascii=False) + "\n")
+                for chapter in self.db.iter_chapters(novel['id']):
+                    f.write(json.dumps({'type': 'chapter', **chapter}, ensure_ascii=False) + "\n")
+                count += 1
+            span.set_attribute("novels", count)
+
+        print(f"Exported {count} novel(s) to {path}")
+        return count
+
+    def export_parquet(self, since: Optional[str] = None) -> int:
+        """
+        Write novels.parquet and chapters.parquet (requires pyarrow).
+
+        Chapters are written in row groups of PARQUET_BATCH_SIZE. Returns the number of novels exported.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow. Install it with: pip install pyarrow")
+
+        novel_schema = pa.schema([
+            ('id', pa.int64()),
+            ('title', pa.string()),
+            ('theme', pa.string()),
+            ('setting', pa.string()),
+            ('plot_outline', pa.string()),
+            ('created_at', pa.string()),
+            ('updated_at', pa.string()),
+        ])
+        chapter_schema = pa.schema([
+            ('id', pa.int64()),
+            ('novel_id', pa.int64()),
+            ('chapter_number', pa.int64()),
+            ('content', pa.string()),
+            ('created_at', pa.string()),
+        ])
+
+        novels_path = os.path.join(self.output_dir, "novels.parquet")
+        chapters_path = os.path.join(self.output_dir, "chapters.parquet")
+        count = 0
+
+        def flush(writer, schema, rows: List[Dict]):
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                rows.clear()
+
+        with tracing.span("export", format="parquet") as span, \
+                pq.ParquetWriter(novels_path, novel_schema) as novel_writer, \
+                pq.ParquetWriter(chapters_path, chapter_schema) as chapter_writer:
+            novel_rows = []
+            chapter_rows = []
+            for novel in self.db.iter_novels(since):
+                novel_rows.append(novel)
+                for chapter in self.db.iter_chapters(novel['id']):
+                    chapter_rows.append(chapter)
+                    if len(chapter_rows) >= self.PARQUET_BATCH_SIZE:
+                        flush(chapter_writer, chapter_schema, chapter_rows)
+                if len(novel_rows) >= self.PARQUET_BATCH_SIZE:
+                    flush(novel_writer, novel_schema, novel_rows)
+                count += 1
+            flush(novel_writer, novel_schema, novel_rows)
+            flush(chapter_writer, chapter_schema, chapter_rows)
+            span.set_attribute("novels", count)
+
+        print(f"Exported {count} novel(s) to {novels_path} and {chapters_path}")
+        return count
+
+    def export_epub(self, since: Optional[str] = None, workers: int = 4) -> List[str]:
+        """Write one EPUB per novel, several novels in parallel. Returns the file paths."""
+        paths = []
+        with tracing.span("export", format="epub", workers=workers) as span:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Bound the novels in flight; executor.map() would drain the whole cursor up front
+                pending = deque()
+                for novel in self.db.iter_novels(since):
+                    if len(pending) >= workers * 2:
+                        paths.append(pending.popleft().result())
+                    pending.append(executor.submit(self._write_epub, novel))
+                while pending:
+                    paths.append(pending.popleft().result())
+            span.set_attribute("novels", len(paths))
+
+        print(f"Exported {len(paths)} EPUB file(s) to {self.output_dir}")
+        return paths
+
+    def _write_epub(self, novel: Dict) -> str:
+        """Write a single novel as an EPUB 3 file, streaming chapters into the archive."""
+        safe_title = re.sub(r'[\\/:*?"<>|]', "_", novel['title'])
+        path = os.path.join(self.output_dir, f"{novel['id']}_{safe_title}.epub")
+        title = html.escape(novel['title'])
+
+        with tracing.span("export.epub", novel_id=novel['id']), \
+                zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub:
+            # The mimetype entry must come first and be stored uncompressed
+            epub.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+            epub.writestr("META-INF/container.xml", _CONTAINER_XML)
+
+            epub.writestr("OEBPS/outline.xhtml", _xhtml_page(title, "情节大纲", novel['plot_outline'] or ""))
+            items = [("outline", "outline.xhtml", "情节大纲")]
+            for chapter in self.db.iter_chapters(novel['id']):
+                number = chapter['chapter_number']
+                name = f"chapter_{number}.xhtml"
+                heading = f"第 {number} 章"
+                epub.writestr(f"OEBPS/{name}", _xhtml_page(title, heading, chapter['content']))
+                items.append((f"chapter_{number}", name, heading))
+
+            epub.writestr("OEBPS/nav.xhtml", _nav_xhtml(title, items))
+            epub.writestr("OEBPS/content.opf", _content_opf(novel, title, items))
+
+        return path
+
+
+_CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>"""
+
+
+def _xhtml_page(title: str, heading: str, text: str) -> str:
+    paragraphs = "\n".join(f"<p>{html.escape(p)}</p>" for p in text.split("\n") if p.strip())
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="zh-CN">
+<head><title>{title}</title></head>
+<body>
+<h2>{html.escape(heading)}</h2>
+{paragraphs}
+</body>
+</html>"""
+
+
+def _nav_xhtml(title: str, items) -> str:
+    links = "\n".join(f'<li><a href="{name}">{html.escape(label)}</a></li>' for _, name, label in items)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="zh-CN">
+<head><title>{title}</title></head>
+<body>
+<nav epub:type="toc"><ol>
+{links}
+</ol></nav>
+</body>
+</html>"""
+
+
+def _content_opf(novel: Dict, title: str, items) -> str:
+    book_id = uuid.uuid5(uuid.NAMESPACE_URL, f"eileen-chang-generator/novel/{novel['id']}")
+    manifest = "\n".join(
+        f'    <item id="{item_id}" href="{name}" media-type="application/xhtml+xml"/>'
+        for item_id, name, _ in items
+    )
+    spine = "\n".join(f'    <itemref idref="{item_id}"/>' for item_id, _, _ in items)
+    modified = str(novel['updated_at'] or novel['created_at']).replace(" ", "T")[:19] + "Z"
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:uuid:{book_id}</dc:identifier>
+    <dc:title>{title}</dc:title>
+    <dc:language>zh-CN</dc:language>
+    <dc:subject>{html.escape(novel['theme'] or "")}</dc:subject>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>"""
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the novel library")
+    parser.add_argument("format", choices=["jsonl", "parquet", "epub"])
+    parser.add_argument("--db", default="novels.db")
+    parser.add_argument("--out", default="exports")
+    parser.add_argument("--since", help='only novels changed after this timestamp, e.g. "2025-11-28 00:00:00"')
+    parser.add_argument("--workers", type=int, default=4, help="parallel novels for EPUB export")
+    args = parser.parse_args()
+
+    exporter = LibraryExporter(NovelDatabase(args.db), args.out)
+    if args.format == "jsonl":
+        exporter.export_jsonl(since=args.since)
+    elif args.format == "parquet":
+        exporter.export_parquet(since=args.since)
+    else:
+        exporter.export_epub(since=args.since, workers=args.workers)
@@ -0,0 +1,204 @@
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Dict, List
+
+from novel_service import create_server
+from generator import EileenChangGenerator
+from novel_database import NovelDatabase
+from session_store import ChapterCache, DraftSession, session_memory_bytes
+
+
+def _request(url: str, payload: Dict = None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(req, timeout=120)
+
+
+def run_client(base_url: str, index: int, num_chapters: int, results: List[Dict]):
+    """Submit one job, follow its SSE stream to the end and fetch the HTML."""
+    started = time.time()
+    result = {'client': index, 'ok': False, 'deltas': 0}
+    try:
+        with _request(f"{base_url}/jobs", {
+            'title': f"压测小说{index}",
+            'theme': "错过的爱情",
+            'setting': "1940年代上海",
+            'num_chapters': num_chapters,
+            'provider': "fake",
+        }) as resp:
+            job_id = json.load(resp)['job_id']
+
+        first_delta = None
+        final = None
+        with _request(f"{base_url}/jobs/{job_id}/events") as resp:
+            for raw in resp:
+                line = raw.decode('utf-8').rstrip("\n")
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event['type'] == 'delta':
+                    result['deltas'] += 1
+                    if first_delta is None:
+                        first_delta = time.time() - started
+                elif event['type'] in ('done', 'failed'):
+                    final = event
+                    break
+
+        if final and final['type'] == 'done':
+            with _request(f"{base_url}/novels/{final['novel_id']}/html") as resp:
+                result['html_bytes'] = len(resp.read())
+            result['ok'] = True
+        else:
+            result['error'] = final
+        result['first_delta'] = first_delta
+    except Exception as e:
+        result['error'] = str(e)
+    result['latency'] = time.time() - started
+    results.append(result)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def load_test(clients: int = 50, workers: int = 8, num_chapters: int = 3):
+    """Run many concurrent clients against an in-process service using the fake LLM."""
+    db_path = os.path.join(tempfile.mkdtemp(), "load_test.db")
+    server = create_server(port=0, workers=workers, db_path=db_path, provider="fake")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"\n{'='*60}")
+    print(f"压测：{clients} 个客户端，{workers} 个工作线程，每本 {num_chapters} 章")
+    print(f"{'='*60}\n")
+
+    results: List[Dict] = []
+    started = time.time()
+    threads = [
+        threading.Thread(target=run_client, args=(base_url, i, num_chapters, results))
+        for i in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    with _request(f"{base_url}/metrics") as resp:
+        metrics = json.load(resp)
+    server.shutdown()
+    server.manager.stop()
+    server.server_close()
+
+    ok = [r for r in results if r['ok']]
+    latencies = [r['latency'] for r in ok]
+    print(f"成功: {len(ok)}/{clients}")
+    print(f"总耗时: {elapsed:.2f}s ({len(ok) / elapsed:.2f} 本/秒)")
+    if latencies:
+        print(f"延迟 p50: {_percentile(latencies, 0.5):.2f}s  p95: {_percentile(latencies, 0.95):.2f}s")
+    for r in results:
+        if not r['ok']:
+            print(f"客户端 {r['client']} 失败: {r.get('error')}")
+    print(f"指标: {json.dumps(metrics, ensure_ascii=False)}")
+
+    return len(ok) == clients
+
+
+def run_session(db: NovelDatabase, cache: ChapterCache, generator: EileenChangGenerator,
+                num_chapters: int, reruns: int, finished: List[int], results: List[Dict]):
+    """
+    Simulate one Streamlit user: plot, chapters, polish, and a rerun per widget interaction,
+    then open a draft another session finished, in a fresh session state.
+    """
+    state: Dict = {}
+    draft = DraftSession(state, db, cache)
+    try:
+        draft.start("压测草稿", "旧上海的爱恨情仇", "1943年的上海",
+                    generator.generate_plot("旧上海的爱恨情仇", "1943年的上海"))
+        for i in range(1, num_chapters + 1):
+            draft.save_chapter(i, generator.generate_chapter(draft.plot(), i))
+        draft.save_chapter(1, generator.polish_text(draft.chapter(1)))
+
+        # Each rerun re-renders the plot and the chapter being viewed
+        for _ in range(reruns):
+            draft.plot()
+            if draft.chapter(random.randint(1, num_chapters)) is None:
+                raise RuntimeError("chapter missing")
+        session_bytes = session_memory_bytes(state)
+
+        # Reopening someone else's draft reads it back through the (likely cold) shared cache
+        if finished:
+            other = DraftSession({'novel_id': random.choice(finished)}, db, cache)
+            if other.plot() is None or any(other.chapter(i) is None for i in other.chapter_numbers()):
+                raise RuntimeError(f"draft {other.novel_id} missing after reopening")
+        finished.append(draft.novel_id)
+        results.append({'ok': True, 'session_bytes': session_bytes})
+    except Exception as e:
+        results.append({'ok': False, 'error': str(e)})
+
+
+def session_load_test(sessions: int = 100, num_chapters: int = 3, reruns: int = 20, cache_chars: int = 50_000):
+    """
+    Run many simulated app sessions sharing one database and chapter cache, using the fake LLM.
+
+    The cache is kept smaller than the sessions' combined drafts so lazy loading and eviction are exercised.
+    """
+    db = NovelDatabase(os.path.join(tempfile.mkdtemp(), "sessions.db"))
+    cache = ChapterCache(max_chars=cache_chars)
+    generator = EileenChangGenerator(provider="fake")
+
+    print(f"\n{'='*60}")
+    print(f"会话压测：{sessions} 个并发会话，每个 {num_chapters} 章，{reruns} 次重绘，缓存上限 {cache_chars} 字")
+    print(f"{'='*60}\n")
+
+    results: List[Dict] = []
+    finished: List[int] = []
+    started = time.time()
+    threads = [
+        threading.Thread(target=run_session, args=(db, cache, generator, num_chapters, reruns, finished, results))
+        for _ in range(sessions)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    ok = [r for r in results if r['ok']]
+    stats = cache.stats()
+    print(f"成功: {len(ok)}/{sessions}")
+    print(f"总耗时: {elapsed:.2f}s")
+    if ok:
+        print(f"每会话状态: 最大 {max(r['session_bytes'] for r in ok)} 字节")
+    for r in results:
+        if not r['ok']:
+            print(f"会话失败: {r['error']}")
+    print(f"共享缓存: {json.dumps(stats, ensure_ascii=False)}")
+    print(f"进程峰值内存: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    # With the cache below the working set, reads must miss and entries must be evicted
+    if not (stats['misses'] and stats['evictions']):
+        print("缓存未发生未命中或淘汰：缓存上限大于工作集，懒加载路径未被测试")
+        return False
+    if stats['chars'] > cache_chars:
+        print("缓存超出上限")
+        return False
+    return len(ok) == sessions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "sessions":
+        sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+        sys.exit(0 if session_load_test(sessions) else 1)
+
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    sys.exit(0 if load_test(clients, workers) else 1)
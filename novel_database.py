@@ -1,33 +1,60 @@
 import sqlite3
 import os
+import glob
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
+import tracing
 
 class NovelDatabase:
-    """Manages storage of generated novels in SQLite database."""
+    """
+    Manages storage of generated novels in SQLite database.
     
-    def __init__(self, db_path: str = "novels.db"):
+    New novels go to the hot database (db_path). compact() moves old novels
+    into yearly read-only archive shards (archive_dir/archive_YYYY.db), which
+    get_novel, list_novels and the iterators open and query transparently,
+    one shard at a time.
+    """
+    
+    # Seconds a connection waits for another writer before raising "database is locked"
+    timeout = 30.0
+    # Once there are more shards than this, compact() merges the oldest ones
+    max_shards = 8
+    
+    def __init__(self, db_path: str = "novels.db", dedup_index=None, archive_dir: Optional[str] = None):
+        """
+        Args:
+            db_path: SQLite database file
+            dedup_index: optional MinHashIndex, kept up to date as novels and chapters are saved
+            archive_dir: directory of archive shards (default: "<db name>_archive" next to db_path)
+        """
         self.db_path = db_path
+        self.dedup_index = dedup_index
+        self.archive_dir = archive_dir or os.path.splitext(db_path)[0] + "_archive"
+        # Shard path -> (mtime, (lowest novel ID, highest novel ID)), see _shard_id_range
+        self._shard_ranges: Dict[str, Tuple] = {}
         self.init_database()
     
-    def init_database(self):
-        """Initialize database with required tables."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS novels (
+    def _create_novel_tables(self, cursor, schema: str = "main"):
+        """Create the novels and chapters tables (and indexes) in the given schema."""
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.novels (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 title TEXT NOT NULL,
                 theme TEXT,
                 setting TEXT,
                 plot_outline TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP
             )
         """)
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chapters (
+        # updated_at (set when the outline is edited) came later; add it to older databases
+        columns = [row[1] for row in cursor.execute(f"PRAGMA {schema}.table_info(novels)")]
+        if "updated_at" not in columns:
+            cursor.execute(f"ALTER TABLE {schema}.novels ADD COLUMN updated_at TIMESTAMP")
+        
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.chapters (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 novel_id INTEGER NOT NULL,
                 chapter_number INTEGER NOT NULL,
@@ -37,55 +64,231 @@ class NovelDatabase:
             )
         """)
         
-        conn.commit()
-        conn.close()
-        print(f"Database initialized: {self.db_path}")
+        # Chapter lookups by novel (exports, get_novel), incremental exports and compaction by time
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_chapters_novel ON chapters (novel_id, chapter_number)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_chapters_created ON chapters (created_at)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_novels_created ON novels (created_at)")
     
-    def save_novel(self, title: str, theme: str, setting: str, plot_outline: str) -> int:
-        """Save a novel and return its ID."""
-        conn = sqlite3.connect(self.db_path)
+    def init_database(self):
+        """Initialize database with required tables."""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
         cursor = conn.cursor()
         
+        # WAL lets readers (page renders, exports) proceed while a session or worker writes
+        cursor.execute("PRAGMA journal_mode=WAL")
+        self._create_novel_tables(cursor)
+        
+        if self.dedup_index:
+            self.dedup_index.init_tables(conn)
+        
         cursor.execute("""
-            INSERT INTO novels (title, theme, setting, plot_outline)
-            VALUES (?, ?, ?, ?)
-        """, (title, theme, setting, plot_outline))
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                theme TEXT,
+                setting TEXT,
+                num_chapters INTEGER NOT NULL,
+                provider TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                novel_id INTEGER,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (novel_id) REFERENCES novels(id)
+            )
+        """)
         
-        novel_id = cursor.lastrowid
         conn.commit()
         conn.close()
         
+        # Bring existing archive shards up to the current schema (they're opened read-only later)
+        for path in self.archive_paths():
+            shard = sqlite3.connect(path, timeout=self.timeout)
+            self._create_novel_tables(shard.cursor())
+            shard.commit()
+            shard.close()
+        print(f"Database initialized: {self.db_path}")
+    
+    def save_novel(self, title: str, theme: str, setting: str, plot_outline: str) -> int:
+        """Save a novel and return its ID."""
+        # Hash before the INSERT so the write lock isn't held while signing
+        sig = self.dedup_index.signature(plot_outline) if self.dedup_index else None
+        with tracing.span("db.write", table="novels", chars=len(plot_outline)):
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO novels (title, theme, setting, plot_outline)
+                VALUES (?, ?, ?, ?)
+            """, (title, theme, setting, plot_outline))
+            
+            novel_id = cursor.lastrowid
+            if self.dedup_index:
+                self.dedup_index.add(conn, "outline", novel_id, novel_id, sig)
+            conn.commit()
+            conn.close()
+        
         print(f"Saved novel: {title} (ID: {novel_id})")
         return novel_id
     
+    def _check_hot(self, cursor, novel_id: int):
+        """
+        Raise ValueError (closing the cursor's connection) unless the novel is in the hot database.
+        
+        Archived novels are read-only; writing a chapter for one would leave an
+        orphan row in the hot database that reads and compact() never see.
+        """
+        if not cursor.execute("SELECT 1 FROM novels WHERE id = ?", (novel_id,)).fetchone():
+            cursor.connection.close()
+            raise ValueError(f"Novel {novel_id} is not in the hot database (archived or missing); it can't be edited")
+    
     def save_chapter(self, novel_id: int, chapter_number: int, content: str):
-        """Save a chapter for a novel."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Save a chapter for a novel. Raises ValueError if the novel isn't in the hot database."""
+        sigs = self.dedup_index.chapter_signatures(content) if self.dedup_index else None
+        with tracing.span("db.write", table="chapters", chars=len(content)):
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            
+            self._check_hot(cursor, novel_id)
+            cursor.execute("""
+                INSERT INTO chapters (novel_id, chapter_number, content)
+                VALUES (?, ?, ?)
+            """, (novel_id, chapter_number, content))
+            
+            if self.dedup_index:
+                self.dedup_index.add_chapter(conn, cursor.lastrowid, novel_id, sigs)
+            conn.commit()
+            conn.close()
         
-        cursor.execute("""
-            INSERT INTO chapters (novel_id, chapter_number, content)
-            VALUES (?, ?, ?)
-        """, (novel_id, chapter_number, content))
+        print(f"Saved chapter {chapter_number} for novel ID {novel_id}")
+    
+    def update_plot_outline(self, novel_id: int, plot_outline: str):
+        """Replace a novel's plot outline (e.g. after editing a draft). Raises ValueError for archived novels."""
+        sig = self.dedup_index.signature(plot_outline) if self.dedup_index else None
+        with tracing.span("db.write", table="novels", chars=len(plot_outline)):
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            updated = conn.execute(
+                "UPDATE novels SET plot_outline = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (plot_outline, novel_id)
+            ).rowcount
+            if not updated:
+                conn.close()
+                raise ValueError(f"Novel {novel_id} is not in the hot database (archived or missing); it can't be edited")
+            if self.dedup_index:
+                self.dedup_index.remove(conn, ["outline"], [novel_id])
+                self.dedup_index.add(conn, "outline", novel_id, novel_id, sig)
+            conn.commit()
+            conn.close()
+    
+    def replace_chapter(self, novel_id: int, chapter_number: int, content: str):
+        """
+        Save a chapter, replacing any existing version (e.g. after regenerating or polishing a draft).
         
-        conn.commit()
+        Raises ValueError if the novel isn't in the hot database.
+        """
+        sigs = self.dedup_index.chapter_signatures(content) if self.dedup_index else None
+        with tracing.span("db.write", table="chapters", chars=len(content)):
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            cursor = conn.cursor()
+            
+            self._check_hot(cursor, novel_id)
+            
+            old_ids = [row[0] for row in cursor.execute(
+                "SELECT id FROM chapters WHERE novel_id = ? AND chapter_number = ?",
+                (novel_id, chapter_number)
+            )]
+            if old_ids:
+                cursor.execute(f"DELETE FROM chapters WHERE id IN ({','.join('?' * len(old_ids))})", old_ids)
+                if self.dedup_index:
+                    self.dedup_index.remove(conn, ["chapter", "opening"], old_ids)
+            
+            cursor.execute("""
+                INSERT INTO chapters (novel_id, chapter_number, content)
+                VALUES (?, ?, ?)
+            """, (novel_id, chapter_number, content))
+            
+            if self.dedup_index:
+                self.dedup_index.add_chapter(conn, cursor.lastrowid, novel_id, sigs)
+            conn.commit()
+            conn.close()
+    
+    def archive_paths(self) -> List[str]:
+        """Paths of the archive shards, oldest first."""
+        return sorted(glob.glob(os.path.join(self.archive_dir, "archive_*.db")), key=self._shard_years)
+    
+    @staticmethod
+    def _shard_years(path: str) -> Tuple[int, int]:
+        """First and last year held by a shard: archive_2023.db -> (2023, 2023), archive_2019-2021.db -> (2019, 2021)."""
+        years = os.path.basename(path)[len("archive_"):-len(".db")].split("-")
+        return int(years[0]), int(years[-1])
+    
+    def _connect(self, path: Optional[str] = None) -> sqlite3.Connection:
+        """Open the hot database, or an archive shard read-only."""
+        if path is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        else:
+            conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def _shard_id_range(self, path: str) -> Tuple[Optional[int], Optional[int]]:
+        """Lowest and highest novel ID in a shard, cached until the shard file changes."""
+        mtime = os.path.getmtime(path)
+        cached = self._shard_ranges.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        conn = self._connect(path)
+        id_range = tuple(conn.execute("SELECT MIN(id), MAX(id) FROM novels").fetchone())
         conn.close()
+        self._shard_ranges[path] = (mtime, id_range)
+        return id_range
+    
+    def _locate_novel(self, novel_id: int):
+        """
+        Find which database holds a novel, checking the hot database first.
         
-        print(f"Saved chapter {chapter_number} for novel ID {novel_id}")
+        Returns (connection, novel row) with the connection opened on the hot
+        database or the shard holding the novel; the row is None if the novel
+        doesn't exist. Only shards whose ID range covers novel_id are opened.
+        The caller closes the connection.
+        """
+        conn = self._connect()
+        novel = conn.execute("SELECT * FROM novels WHERE id = ?", (novel_id,)).fetchone()
+        if novel:
+            return conn, novel
+        
+        for path in self.archive_paths():
+            low, high = self._shard_id_range(path)
+            if low is None or not low <= novel_id <= high:
+                continue
+            shard = self._connect(path)
+            novel = shard.execute("SELECT * FROM novels WHERE id = ?", (novel_id,)).fetchone()
+            if novel:
+                conn.close()
+                return shard, novel
+            shard.close()
+        return conn, None
+    
+    def is_archived(self, novel_id: int) -> bool:
+        """True if the novel has been moved to an archive shard, where it is read-only."""
+        conn = self._connect()
+        in_hot = conn.execute("SELECT 1 FROM novels WHERE id = ?", (novel_id,)).fetchone()
+        conn.close()
+        if in_hot:
+            return False
+        conn, novel = self._locate_novel(novel_id)
+        conn.close()
+        return novel is not None
     
     def get_novel(self, novel_id: int) -> Optional[Dict]:
-        """Retrieve a novel with all its chapters."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM novels WHERE id = ?", (novel_id,))
-        novel = cursor.fetchone()
+        """Retrieve a novel with all its chapters, from the hot database or an archive shard."""
+        conn, novel = self._locate_novel(novel_id)
         
         if not novel:
             conn.close()
             return None
         
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT * FROM chapters 
             WHERE novel_id = ? 
@@ -102,28 +305,348 @@ class NovelDatabase:
             'setting': novel['setting'],
             'plot_outline': novel['plot_outline'],
             'created_at': novel['created_at'],
+            'updated_at': novel['updated_at'],
             'chapters': [dict(chapter) for chapter in chapters]
         }
     
-    def list_novels(self) -> List[Dict]:
-        """List all novels."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+    def get_plot_outline(self, novel_id: int) -> Optional[str]:
+        """Retrieve only a novel's plot outline."""
+        conn, novel = self._locate_novel(novel_id)
+        conn.close()
+        return novel['plot_outline'] if novel else None
+    
+    def get_chapter(self, novel_id: int, chapter_number: int) -> Optional[str]:
+        """Retrieve the text of a single chapter."""
+        conn, novel = self._locate_novel(novel_id)
+        row = None
+        if novel:
+            row = conn.execute("""
+                SELECT content FROM chapters
+                WHERE novel_id = ? AND chapter_number = ?
+                ORDER BY id DESC LIMIT 1
+            """, (novel_id, chapter_number)).fetchone()
+        conn.close()
+        return row['content'] if row else None
+    
+    def get_chapter_numbers(self, novel_id: int) -> List[int]:
+        """Chapter numbers saved for a novel, without loading their text."""
+        conn, _ = self._locate_novel(novel_id)
+        numbers = [row[0] for row in conn.execute("""
+            SELECT DISTINCT chapter_number FROM chapters
+            WHERE novel_id = ?
+            ORDER BY chapter_number
+        """, (novel_id,))]
+        conn.close()
+        return numbers
+    
+    def list_novels(self, include_archive: bool = False) -> List[Dict]:
+        """
+        List novels in the hot database, newest first.
+        
+        With include_archive=True every archive shard is read too (one at a
+        time) and merged in; that grows with the whole library, so only ask for it when needed.
+        """
+        paths = [None] + (self.archive_paths() if include_archive else [])
+        novels = []
+        for path in paths:
+            conn = self._connect(path)
+            novels.extend(dict(row) for row in conn.execute("""
+                SELECT n.*, COUNT(c.id) as chapter_count
+                FROM novels n
+                LEFT JOIN chapters c ON n.id = c.novel_id
+                GROUP BY n.id
+            """))
+            conn.close()
+        
+        # An interrupted compact() can leave a novel in both files; the hot copy wins
+        seen = set()
+        novels = [novel for novel in novels if not (novel['id'] in seen or seen.add(novel['id']))]
+        
+        novels.sort(key=lambda novel: novel['created_at'], reverse=True)
+        return novels
+    
+    def compact(self, before: str, vacuum: bool = True) -> int:
+        """
+        Move novels created before `before` (with their chapters) into yearly archive shards.
+        
+        Args:
+            before: cutoff timestamp, e.g. "2025-01-01" (compared with created_at, UTC)
+            vacuum: VACUUM the hot database afterwards to return the freed space
+        
+        Returns the number of novels moved. Novel IDs are preserved, and since
+        the hot tables use AUTOINCREMENT they are never reused for new novels.
+        A year already covered by a merged shard (see _merge_shards) goes into
+        that shard. The dedup index stays in the hot database and keeps covering
+        archived outlines and chapters, so new chapters are still checked against all history.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        years = [row[0] for row in conn.execute("""
+            SELECT DISTINCT strftime('%Y', created_at) FROM novels
+            WHERE created_at < ?
+        """, (before,))]
+        
+        # Shard path -> years to move into it. Every existing shard is visited too, to finish
+        # moving novels an interrupted run left in both files
+        targets = {path: [] for path in self.archive_paths()}
+        for year in years:
+            targets.setdefault(self._shard_for_year(int(year)), []).append(year)
+        if targets and not os.path.exists(self.archive_dir):
+            os.makedirs(self.archive_dir)
+        
+        moved = 0
+        for path, shard_years in targets.items():
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                self._create_novel_tables(conn.cursor(), schema="shard")
+                conn.execute(f"""
+                    CREATE TEMP TABLE moving AS
+                    SELECT id FROM novels
+                    WHERE (created_at < ? AND strftime('%Y', created_at) IN ({','.join('?' * len(shard_years))}))
+                       OR id IN (SELECT id FROM shard.novels)
+                """, [before] + shard_years)
+                
+                # The two files don't commit atomically together (the hot database is in WAL mode),
+                # so copy in one transaction and delete in a second. A crash in between leaves a
+                # novel in both files: reads prefer the hot copy, and the next run copies it again,
+                # replacing the shard rows, before deleting it
+                conn.execute("BEGIN")
+                conn.execute("DELETE FROM shard.chapters WHERE novel_id IN (SELECT id FROM moving)")
+                conn.execute("INSERT OR REPLACE INTO shard.novels SELECT * FROM novels WHERE id IN (SELECT id FROM moving)")
+                conn.execute("INSERT INTO shard.chapters SELECT * FROM chapters WHERE novel_id IN (SELECT id FROM moving)")
+                conn.commit()
+                
+                # Delete only novels still identical to their copy. One edited or given a chapter
+                # since then stays whole in the hot database, and the next run copies it again.
+                # IMMEDIATE holds the write lock from the check to the delete
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("""
+                    DELETE FROM moving
+                    WHERE id NOT IN (SELECT id FROM shard.novels)
+                       OR (SELECT plot_outline FROM novels n WHERE n.id = moving.id)
+                          IS NOT (SELECT plot_outline FROM shard.novels s WHERE s.id = moving.id)
+                       OR EXISTS (SELECT 1 FROM chapters c WHERE c.novel_id = moving.id
+                                  AND c.id NOT IN (SELECT id FROM shard.chapters))
+                       OR EXISTS (SELECT 1 FROM shard.chapters c WHERE c.novel_id = moving.id
+                                  AND c.id NOT IN (SELECT id FROM chapters))
+                """)
+                conn.execute("DELETE FROM chapters WHERE novel_id IN (SELECT id FROM moving)")
+                count = conn.execute("DELETE FROM novels WHERE id IN (SELECT id FROM moving)").rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DROP TABLE IF EXISTS temp.moving")
+                conn.execute("DETACH DATABASE shard")
+            moved += count
+            if count:
+                print(f"Archived {count} novel(s) to {path}")
+        
+        if not moved:
+            print("Nothing to compact.")
+        elif vacuum:
+            conn.execute("VACUUM")
+        conn.close()
+        
+        self._merge_shards()
+        return moved
+    
+    def _shard_for_year(self, year: int) -> str:
+        """The shard covering `year`, or the path of a new yearly shard."""
+        for path in self.archive_paths():
+            first, last = self._shard_years(path)
+            if first <= year <= last:
+                return path
+        return os.path.join(self.archive_dir, f"archive_{year}.db")
+    
+    def _merge_shards(self):
+        """
+        Merge the two oldest shards into one archive_FIRST-LAST.db until at
+        most max_shards remain, so the number of files to search stays bounded.
+        
+        The newer shard's rows are copied into the older one, the newer file
+        is removed and the older one renamed. If interrupted, the next
+        compaction repeats the merge; copies use INSERT OR REPLACE so rows
+        already copied are simply overwritten.
+        """
+        paths = self.archive_paths()
+        while len(paths) > self.max_shards:
+            older, newer = paths[0], paths[1]
+            merged = os.path.join(
+                self.archive_dir,
+                f"archive_{self._shard_years(older)[0]}-{self._shard_years(newer)[1]}.db"
+            )
+            conn = sqlite3.connect(older, timeout=self.timeout)
+            conn.execute("ATTACH DATABASE ? AS newer", (newer,))
+            conn.execute("BEGIN")
+            conn.execute("INSERT OR REPLACE INTO novels SELECT * FROM newer.novels")
+            conn.execute("INSERT OR REPLACE INTO chapters SELECT * FROM newer.chapters")
+            conn.commit()
+            conn.execute("DETACH DATABASE newer")
+            conn.close()
+            os.remove(newer)
+            os.replace(older, merged)
+            print(f"Merged {os.path.basename(older)} and {os.path.basename(newer)} into {merged}")
+            paths = self.archive_paths()
+    
+    def find_similar(self, text: str, kind: Optional[str] = None, threshold: float = 0.5, limit: int = 10) -> List[Dict]:
+        """
+        Find stored outlines/chapters/openings similar to `text` using the dedup index.
+        
+        Returns dicts with kind, ref_id (novel ID for outlines, chapter ID otherwise),
+        novel_id and estimated similarity, most similar first.
+        """
+        if not self.dedup_index:
+            raise ValueError("No dedup_index configured for this database")
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            return self.dedup_index.query(conn, text, kind=kind, threshold=threshold, limit=limit)
+        finally:
+            conn.close()
+    
+    def rebuild_dedup_index(self):
+        """Re-index every stored outline and chapter (e.g. after enabling the index on an existing library)."""
+        if not self.dedup_index:
+            raise ValueError("No dedup_index configured for this database")
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        conn.execute("DELETE FROM minhash_buckets")
+        conn.execute("DELETE FROM minhash_signatures")
+        conn.commit()
+        # One short write per novel, with its signatures computed before the lock is taken
+        for novel in self.iter_novels():
+            outline_sig = self.dedup_index.signature(novel['plot_outline'] or "")
+            chapters = [(chapter['id'], self.dedup_index.chapter_signatures(chapter['content']))
+                        for chapter in self.iter_chapters(novel['id'])]
+            self.dedup_index.add(conn, "outline", novel['id'], novel['id'], outline_sig)
+            for chapter_id, sigs in chapters:
+                self.dedup_index.add_chapter(conn, chapter_id, novel['id'], sigs)
+            conn.commit()
+        conn.close()
+        print(f"Rebuilt dedup index: {self.db_path}")
+    
+    def iter_novels(self, since: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Stream novels (without chapters) one row at a time: archive shards
+        oldest first, then the hot database, each in ID order.
+        
+        Args:
+            since: only novels created, edited or given new chapters after this
+                   timestamp ("YYYY-MM-DD HH:MM:SS", UTC like created_at)
+        """
+        for path in self.archive_paths() + [None]:
+            conn = self._connect(path)
+            try:
+                # Skip shard rows for novels still in the hot database (left by an interrupted
+                # compact()); the hot copy is yielded at the end
+                skip_hot = ""
+                if path:
+                    conn.execute("ATTACH DATABASE ? AS hot", (f"file:{os.path.abspath(self.db_path)}?mode=ro",))
+                    skip_hot = "AND n.id NOT IN (SELECT id FROM hot.novels)"
+                if since:
+                    cursor = conn.execute(f"""
+                        SELECT * FROM novels n
+                        WHERE (n.created_at > ?
+                               OR n.updated_at > ?
+                               OR EXISTS (SELECT 1 FROM chapters c
+                                          WHERE c.novel_id = n.id AND c.created_at > ?))
+                          {skip_hot}
+                        ORDER BY n.id
+                    """, (since, since, since))
+                else:
+                    cursor = conn.execute(f"SELECT * FROM novels n WHERE 1 {skip_hot} ORDER BY n.id")
+                for row in cursor:
+                    yield dict(row)
+            finally:
+                conn.close()
+    
+    def iter_chapters(self, novel_id: int) -> Iterator[Dict]:
+        """Stream a novel's chapters in order, one row at a time."""
+        conn, _ = self._locate_novel(novel_id)
+        try:
+            cursor = conn.execute("""
+                SELECT * FROM chapters
+                WHERE novel_id = ?
+                ORDER BY chapter_number
+            """, (novel_id,))
+            for row in cursor:
+                yield dict(row)
+        finally:
+            conn.close()
+    
+    def create_job(self, title: str, theme: str, setting: str, num_chapters: int, provider: str) -> int:
+        """Queue a generation job and return its ID."""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
         cursor = conn.cursor()
         
         cursor.execute("""
-            SELECT n.*, COUNT(c.id) as chapter_count
-            FROM novels n
-            LEFT JOIN chapters c ON n.id = c.novel_id
-            GROUP BY n.id
-            ORDER BY n.created_at DESC
-        """)
+            INSERT INTO jobs (title, theme, setting, num_chapters, provider)
+            VALUES (?, ?, ?, ?, ?)
+        """, (title, theme, setting, num_chapters, provider))
         
-        novels = [dict(row) for row in cursor.fetchall()]
+        job_id = cursor.lastrowid
+        conn.commit()
         conn.close()
         
-        return novels
+        return job_id
+    
+    def update_job(self, job_id: int, status: str, novel_id: Optional[int] = None, error: Optional[str] = None):
+        """Update a job's status, and optionally its novel ID or error."""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE jobs
+            SET status = ?,
+                novel_id = COALESCE(?, novel_id),
+                error = COALESCE(?, error),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, novel_id, error, job_id))
+        
+        conn.commit()
+        conn.close()
+    
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        """Retrieve a job by ID."""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        job = cursor.fetchone()
+        conn.close()
+        
+        return dict(job) if job else None
+    
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict]:
+        """List jobs, optionally filtered by status."""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        if status:
+            cursor.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,))
+        else:
+            cursor.execute("SELECT * FROM jobs ORDER BY id")
+        
+        jobs = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        
+        return jobs
 
 if __name__ == "__main__":
-    db = NovelDatabase()
-    print("Database test successful!")
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Novel database tools")
+    parser.add_argument("--db", default="novels.db")
+    parser.add_argument("--archive-dir", help="archive shard directory (default: <db name>_archive)")
+    parser.add_argument("--compact-before", metavar="TIMESTAMP",
+                        help='move novels created before this into archive shards, e.g. "2025-01-01"')
+    args = parser.parse_args()
+    
+    db = NovelDatabase(args.db, archive_dir=args.archive_dir)
+    if args.compact_before:
+        moved = db.compact(args.compact_before)
+        print(f"Compaction done: {moved} novel(s) archived, {len(db.archive_paths())} shard(s)")
+    else:
+        print("Database test successful!")
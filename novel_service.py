@@ -0,0 +1,470 @@
+import asyncio
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from generator import EileenChangGenerator
+from novel_database import NovelDatabase
+from html_generator import HTMLGenerator
+from dedup_index import MinHashIndex, DuplicateGuard, NearDuplicateError
+import tracing
+
+
+class JobManager:
+    """
+    Runs novel generation jobs on a pool of async workers.
+
+    Jobs are persisted in the database's jobs table, so anything still
+    queued or running when the service stops is picked up again on restart.
+    Progress events (stage changes and chapter deltas) are fanned out to
+    any number of subscribers per job.
+    """
+
+    def __init__(self, db: NovelDatabase, workers: int = 4):
+        self.db = db
+        self.workers = workers
+        # Chapters whose opening repeats a stored one are aborted and regenerated
+        self.guard = DuplicateGuard(db) if db.dedup_index else None
+        self._generators: Dict[str, EileenChangGenerator] = {}
+        self._generators_lock = threading.Lock()
+
+        # Events of jobs in flight, replayed to late subscribers
+        self._history: Dict[int, List[Dict]] = {}
+        self._subscribers: Dict[int, List[queue.Queue]] = {}
+        self._events_lock = threading.Lock()
+
+        self._metrics = {
+            'jobs_submitted': 0,
+            'jobs_completed': 0,
+            'jobs_failed': 0,
+            'jobs_running': 0,
+            'chapters_generated': 0,
+            'chars_generated': 0,
+            'duplicates_aborted': 0,
+            'generation_seconds': 0.0,
+        }
+        self._metrics_lock = threading.Lock()
+        self._started_at = time.time()
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="novel-worker")
+        self._loop = asyncio.new_event_loop()
+        self._queue: Optional[asyncio.Queue] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="job-manager", daemon=True)
+
+    def start(self):
+        """Start the worker pool and re-queue unfinished jobs."""
+        self._thread.start()
+        self._ready.wait()
+        for status in ('running', 'queued'):
+            for job in self.db.list_jobs(status):
+                self.db.update_job(job['id'], 'queued')
+                self._enqueue(job['id'])
+
+    def stop(self):
+        """Stop the worker pool. Jobs in flight stay persisted for the next start."""
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._loop.stop()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._loop.run_in_executor(self._executor, self._run_job, job_id)
+            finally:
+                self._queue.task_done()
+
+    def _enqueue(self, job_id: int):
+        with self._events_lock:
+            self._history.setdefault(job_id, [])
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+
+    def submit(self, title: str, theme: str, setting: str, num_chapters: int, provider: str) -> int:
+        """Persist a new job, queue it for the workers and return its ID."""
+        job_id = self.db.create_job(title, theme, setting, num_chapters, provider)
+        self._inc('jobs_submitted')
+        self._enqueue(job_id)
+        return job_id
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _get_generator(self, provider: str) -> EileenChangGenerator:
+        """Return a shared generator for the provider, creating it on first use."""
+        with self._generators_lock:
+            if provider not in self._generators:
+                self._generators[provider] = EileenChangGenerator(provider=provider)
+            return self._generators[provider]
+
+    def _inc(self, name: str, amount=1):
+        with self._metrics_lock:
+            self._metrics[name] += amount
+
+    def metrics(self) -> Dict:
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        with self._events_lock:
+            snapshot['sse_subscribers'] = sum(len(subs) for subs in self._subscribers.values())
+        snapshot['jobs_queued'] = self.queue_depth()
+        snapshot['workers'] = self.workers
+        snapshot['uptime_seconds'] = round(time.time() - self._started_at, 3)
+        return snapshot
+
+    def _publish(self, job_id: int, event: Dict, final: bool = False):
+        """Send an event to every subscriber of a job."""
+        with self._events_lock:
+            if final:
+                self._history.pop(job_id, None)
+                subscribers = self._subscribers.pop(job_id, [])
+            else:
+                self._history.setdefault(job_id, []).append(event)
+                subscribers = list(self._subscribers.get(job_id, []))
+        for sub in subscribers:
+            sub.put(event)
+
+    def subscribe(self, job_id: int) -> Optional[queue.Queue]:
+        """
+        Subscribe to a job's events.
+
+        Returns a queue pre-filled with the events so far, or None if the
+        job is not in flight (finished or unknown).
+        """
+        with self._events_lock:
+            if job_id not in self._history:
+                return None
+            sub = queue.Queue()
+            for event in self._history[job_id]:
+                sub.put(event)
+            self._subscribers.setdefault(job_id, []).append(sub)
+            return sub
+
+    def unsubscribe(self, job_id: int, sub: queue.Queue):
+        with self._events_lock:
+            subs = self._subscribers.get(job_id, [])
+            if sub in subs:
+                subs.remove(sub)
+
+    def _run_job(self, job_id: int):
+        """Generate a novel for a job. Mirrors generate_and_save.generate_novel."""
+        job = self.db.get_job(job_id)
+        if not job:
+            self._publish(job_id, {'type': 'failed', 'error': 'job not found'}, final=True)
+            return
+
+        self.db.update_job(job_id, 'running')
+        self._inc('jobs_running')
+        started = time.time()
+        try:
+            with tracing.span("novel", job_id=job_id, title=job['title'], provider=job['provider']):
+                novel_id = self._generate(job_id, job)
+            self.db.update_job(job_id, 'done')
+            self._inc('jobs_completed')
+            self._publish(job_id, {'type': 'done', 'novel_id': novel_id}, final=True)
+        except Exception as e:
+            self.db.update_job(job_id, 'failed', error=str(e))
+            self._inc('jobs_failed')
+            self._publish(job_id, {'type': 'failed', 'error': str(e)}, final=True)
+        finally:
+            self._inc('jobs_running', -1)
+            self._inc('generation_seconds', time.time() - started)
+
+    def _generate(self, job_id: int, job: Dict) -> int:
+        """
+        Run the generation stages for a job and return the novel ID.
+
+        A job interrupted by a restart already has a novel_id: its plot and
+        saved chapters are reused and generation continues after the last one.
+        """
+        generator = self._get_generator(job['provider'])
+        novel_id = job['novel_id']
+        plot_outline = self.db.get_plot_outline(novel_id) if novel_id else None
+        done_chapters = set()
+        previous_context = ""
+
+        if plot_outline is None:
+            self._publish(job_id, {'type': 'stage', 'stage': 'plot'})
+            with tracing.span("stage", stage="plot"):
+                plot_outline = generator.generate_plot(job['theme'], job['setting'])
+                novel_id = self.db.save_novel(job['title'], job['theme'], job['setting'], plot_outline)
+            self.db.update_job(job_id, 'running', novel_id=novel_id)
+        else:
+            done_chapters = set(self.db.get_chapter_numbers(novel_id))
+            if done_chapters:
+                last = self.db.get_chapter(novel_id, max(done_chapters))
+                previous_context = last[-500:] if len(last) > 500 else last
+            self._publish(job_id, {'type': 'resume', 'novel_id': novel_id, 'chapters_done': sorted(done_chapters)})
+        self._publish(job_id, {'type': 'plot', 'novel_id': novel_id, 'chars': len(plot_outline)})
+
+        for i in range(1, job['num_chapters'] + 1):
+            if i in done_chapters:
+                continue
+            self._publish(job_id, {'type': 'stage', 'stage': 'chapter', 'chapter_number': i})
+            with tracing.span("stage", stage="chapter", chapter_number=i):
+                chapter_content = self._stream_chapter(job_id, generator, plot_outline, i, previous_context)
+                self.db.save_chapter(novel_id, i, chapter_content)
+                self._inc('chapters_generated')
+                self._inc('chars_generated', len(chapter_content))
+                self._publish(job_id, {'type': 'chapter', 'chapter_number': i, 'chars': len(chapter_content)})
+
+            previous_context = chapter_content[-500:] if len(chapter_content) > 500 else chapter_content
+
+        return novel_id
+
+    def _stream_chapter(self, job_id: int, generator: EileenChangGenerator, plot_outline: str,
+                        chapter_number: int, previous_context: str) -> str:
+        """Stream one chapter to subscribers, regenerating it if the duplicate guard trips."""
+        attempts = self.guard.max_attempts if self.guard else 1
+        for attempt in range(1, attempts + 1):
+            stream = generator.generate_chapter_stream(plot_outline, chapter_number, previous_context)
+            if self.guard and attempt < attempts:
+                stream = self.guard.watch(stream)
+            parts = []
+            try:
+                for delta in stream:
+                    parts.append(delta)
+                    self._publish(job_id, {'type': 'delta', 'chapter_number': chapter_number, 'text': delta})
+                return "".join(parts)
+            except NearDuplicateError as e:
+                self._inc('duplicates_aborted')
+                # Clients discard the deltas received so far for this chapter
+                self._publish(job_id, {
+                    'type': 'retry',
+                    'chapter_number': chapter_number,
+                    'attempt': attempt,
+                    'reason': str(e),
+                })
+
+
+class NovelRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API for the job service.
+
+    POST /jobs                 submit a job (JSON body: title, theme, setting, num_chapters, provider)
+    GET  /jobs/<id>            job status
+    GET  /jobs/<id>/events     server-sent events with stage progress and chapter deltas
+    GET  /novels               list recent novels (?archive=1 to include archive shards)
+    GET  /novels/<id>/html     rendered HTML for a novel
+    POST /similar              near-duplicate lookup (JSON body: text, kind, threshold)
+    GET  /health               liveness check
+    GET  /metrics              worker and throughput counters
+    """
+
+    manager: JobManager = None
+    default_provider = "groq"
+    keepalive_seconds = 15
+
+    def log_message(self, format, *args):
+        # Per-request logging is too noisy with many SSE clients
+        pass
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json({'error': message}, status)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        if self.path == "/similar":
+            return self._similar()
+        if self.path != "/jobs":
+            return self._send_error(404, "not found")
+
+        try:
+            data = self._read_json()
+            title = data['title']
+            num_chapters = int(data.get('num_chapters', 3))
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_error(400, f"invalid job: {e}")
+        if num_chapters < 1:
+            return self._send_error(400, "num_chapters must be at least 1")
+
+        job_id = self.manager.submit(
+            title,
+            data.get('theme', ''),
+            data.get('setting', ''),
+            num_chapters,
+            data.get('provider', self.default_provider),
+        )
+        self._send_json({'job_id': job_id, 'status': 'queued'}, 202)
+
+    def _similar(self):
+        if not self.manager.db.dedup_index:
+            return self._send_error(404, "dedup index disabled")
+        try:
+            data = self._read_json()
+            matches = self.manager.db.find_similar(
+                data['text'],
+                kind=data.get('kind'),
+                threshold=float(data.get('threshold', 0.5)),
+                limit=int(data.get('limit', 10)),
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_error(400, f"invalid query: {e}")
+        self._send_json(matches)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+
+        if path == "/health":
+            return self._send_json({'status': 'ok'})
+        if path == "/metrics":
+            return self._send_json(self.manager.metrics())
+        if path == "/novels":
+            # Archive shards are only read on request (?archive=1), so listing stays fast
+            include_archive = "archive=1" in self.path.partition("?")[2].split("&")
+            return self._send_json(self.manager.db.list_novels(include_archive=include_archive))
+
+        match = re.fullmatch(r"/jobs/(\d+)(/events)?", path)
+        if match:
+            job_id = int(match.group(1))
+            if match.group(2):
+                return self._stream_events(job_id)
+            job = self.manager.db.get_job(job_id)
+            if not job:
+                return self._send_error(404, "job not found")
+            return self._send_json(job)
+
+        match = re.fullmatch(r"/novels/(\d+)/html", path)
+        if match:
+            novel_data = self.manager.db.get_novel(int(match.group(1)))
+            if not novel_data:
+                return self._send_error(404, "novel not found")
+            body = HTMLGenerator.render_novel_html(novel_data).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self._send_error(404, "not found")
+
+    def _write_event(self, event: Dict):
+        data = json.dumps(event, ensure_ascii=False)
+        self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _stream_events(self, job_id: int):
+        sub = self.manager.subscribe(job_id)
+        if sub is None:
+            # Job already finished (or never existed): report its final state
+            job = self.manager.db.get_job(job_id)
+            if not job:
+                return self._send_error(404, "job not found")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        if sub is None:
+            if job['status'] == 'failed':
+                self._write_event({'type': 'failed', 'error': job['error']})
+            else:
+                self._write_event({'type': job['status'], 'novel_id': job['novel_id']})
+            return
+
+        try:
+            while True:
+                try:
+                    event = sub.get(timeout=self.keepalive_seconds)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                self._write_event(event)
+                if event['type'] in ('done', 'failed'):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.manager.unsubscribe(job_id, sub)
+
+
+class NovelHTTPServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer with a configurable listen backlog.
+
+    The stdlib default of 5 pending connections resets clients as soon as a
+    burst of them connects at once (SSE streams keep their threads busy).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler, backlog: int = 128):
+        # Must be set before the base class calls listen()
+        self.request_queue_size = backlog
+        super().__init__(server_address, handler)
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8000, workers: int = 4,
+                  db_path: str = "novels.db", provider: str = "groq", dedup: bool = True,
+                  backlog: int = 128) -> NovelHTTPServer:
+    """Create the HTTP server with a started job manager attached as `server.manager`."""
+    db = NovelDatabase(db_path, dedup_index=MinHashIndex() if dedup else None)
+    manager = JobManager(db, workers=workers)
+    manager.start()
+
+    handler = type("BoundNovelRequestHandler", (NovelRequestHandler,), {
+        'manager': manager,
+        'default_provider': provider,
+    })
+    server = NovelHTTPServer((host, port), handler, backlog=backlog)
+    server.manager = manager
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Novel generation job service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4, help="max concurrent generation jobs")
+    parser.add_argument("--backlog", type=int, default=128, help="pending connections queued before clients are refused")
+    parser.add_argument("--db", default="novels.db")
+    parser.add_argument("--provider", default="groq", help="default provider for jobs that don't set one")
+    parser.add_argument("--no-dedup", action="store_true", help="disable the near-duplicate index and guard")
+    args = parser.parse_args()
+
+    tracing.configure_from_env()
+    server = create_server(args.host, args.port, args.workers, args.db, args.provider,
+                           dedup=not args.no_dedup, backlog=args.backlog)
+    print(f"Serving on http://{args.host}:{args.port} ({args.workers} workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.manager.stop()
+        server.server_close()
+        tracing.tracer.shutdown()
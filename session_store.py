@@ -0,0 +1,124 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+from novel_database import NovelDatabase
+
+
+class ChapterCache:
+    """
+    Thread-safe LRU of draft texts shared by all sessions.
+
+    Bounded by the total number of characters held, so a few very long
+    chapters can't push memory past the budget.
+    """
+
+    def __init__(self, max_chars: int = 2_000_000):
+        self.max_chars = max_chars
+        self._items: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            text = self._items.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: Tuple, text: str):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._chars -= len(old)
+            if len(text) > self.max_chars:
+                return
+            self._items[key] = text
+            self._chars += len(text)
+            while self._chars > self.max_chars:
+                _, evicted = self._items.popitem(last=False)
+                self._chars -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'chars': self._chars,
+                'max_chars': self.max_chars,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DraftSession:
+    """
+    A user's draft novel, with only its ID kept in session state.
+
+    The plot outline and chapters live in the database and are read on
+    demand through the shared ChapterCache, so session state stays a few
+    bytes per user however long the chapters get, and drafts survive restarts.
+    """
+
+    def __init__(self, state: MutableMapping, db: NovelDatabase, cache: ChapterCache):
+        self.state = state
+        self.db = db
+        self.cache = cache
+
+    @property
+    def novel_id(self) -> Optional[int]:
+        return self.state.get('novel_id')
+
+    def start(self, title: str, theme: str, setting: str, plot_outline: str) -> int:
+        """Store a new draft and make it this session's current novel."""
+        novel_id = self.db.save_novel(title, theme, setting, plot_outline)
+        self.state['novel_id'] = novel_id
+        self.cache.put((novel_id, 'plot'), plot_outline)
+        return novel_id
+
+    def plot(self) -> Optional[str]:
+        key = (self.novel_id, 'plot')
+        text = self.cache.get(key)
+        if text is None:
+            text = self.db.get_plot_outline(self.novel_id)
+            if text is not None:
+                self.cache.put(key, text)
+        return text
+
+    def set_plot(self, plot_outline: str):
+        if plot_outline == self.plot():
+            return
+        self.db.update_plot_outline(self.novel_id, plot_outline)
+        self.cache.put((self.novel_id, 'plot'), plot_outline)
+
+    def chapter(self, chapter_number: int) -> Optional[str]:
+        key = (self.novel_id, chapter_number)
+        text = self.cache.get(key)
+        if text is None:
+            text = self.db.get_chapter(self.novel_id, chapter_number)
+            if text is not None:
+                self.cache.put(key, text)
+        return text
+
+    def chapter_numbers(self) -> List[int]:
+        return self.db.get_chapter_numbers(self.novel_id)
+
+    def save_chapter(self, chapter_number: int, content: str):
+        """Store a chapter, replacing any earlier version of it."""
+        self.db.replace_chapter(self.novel_id, chapter_number, content)
+        self.cache.put((self.novel_id, chapter_number), content)
+
+
+def session_memory_bytes(state: MutableMapping) -> int:
+    """Approximate bytes held by a session state mapping (keys plus values, one level deep)."""
+    return sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in state.items())
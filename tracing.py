@@ -0,0 +1,285 @@
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+class Span:
+    """A timed unit of work with attributes, nested under the span that was current when it started."""
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict, parent: Optional["Span"]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.span_id = next(tracer._ids)
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self._token = None
+        self._profiler = None
+        self._mem_start = None
+
+        if tracer.memory:
+            self._mem_start = tracemalloc.get_traced_memory()[0]
+        if name in tracer.profile:
+            self._start_profiler()
+
+    def _start_profiler(self):
+        # Only one cProfile profiler may run at a time: before Python 3.12 a second one
+        # silently replaces the first on its thread, and from 3.12 (sys.monitoring) enable()
+        # raises ValueError while any profiler in the process is active. So profile only
+        # while no other span is profiling, and record why a span was skipped otherwise
+        tracer = self.tracer
+        if not tracer._profile_lock.acquire(blocking=False):
+            active = tracer._profiling_span
+            self.attributes['profile_skipped'] = f"{active.name if active else 'another span'} is being profiled"
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiling tool (not a span) is active
+            tracer._profile_lock.release()
+            self.attributes['profile_skipped'] = str(e)
+            return
+        tracer._profiling_span = self
+        self._profiler = profiler
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        """Finish the span and hand it to the exporters. Safe to call twice."""
+        if self.end_ns is not None:
+            return
+        if self._profiler:
+            self._profiler.disable()
+            self.tracer._profiling_span = None
+            self.tracer._profile_lock.release()
+            path = os.path.join(self.tracer.profile_dir, f"{self.name}_{self.span_id}.prof")
+            self._profiler.dump_stats(path)
+            self.attributes['profile'] = path
+        if self._mem_start is not None:
+            self.attributes['mem_delta_bytes'] = tracemalloc.get_traced_memory()[0] - self._mem_start
+        self.end_ns = time.perf_counter_ns()
+        self.tracer._export(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'thread_id': self.thread_id,
+            'start_us': self.start_ns // 1000,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+        }
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes['error'] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+class _NoopSpan:
+    """Returned when tracing is off, so instrumented code pays almost nothing."""
+
+    duration_ms = 0.0
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+class JSONLExporter:
+    """Appends one JSON object per finished span to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            # Flush per span so a killed long-running service keeps what it traced
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class ChromeTraceExporter:
+    """
+    Streams spans to a file in Chrome trace format (open in chrome://tracing or Perfetto).
+
+    Events are written as they finish, so memory stays flat in long-running
+    processes. The file uses the bare JSON array format, which the viewers
+    still load when it was cut off before close() wrote the closing bracket.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[\n')
+        self._first = True
+
+    def export(self, span: Span):
+        event = {
+            'name': span.name,
+            'ph': 'X',
+            'ts': span.start_ns / 1000,
+            'dur': (span.end_ns - span.start_ns) / 1000,
+            'pid': os.getpid(),
+            'tid': span.thread_id,
+            'args': span.attributes,
+        }
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line if self._first else ",\n" + line)
+            self._first = False
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.write("\n]\n")
+            self._file.close()
+
+class Tracer:
+    """
+    Lightweight span tracer.
+
+    Tracing is off until configure() is given at least one exporter or span
+    name to profile; until then span() returns a shared no-op span.
+    """
+
+    def __init__(self):
+        self.exporters: List = []
+        self.enabled = False
+        self.profile = frozenset()
+        self.profile_dir = "."
+        self.memory = False
+        self._ids = itertools.count(1)
+        # Held by the span running the process's one cProfile profiler (see Span._start_profiler)
+        self._profile_lock = threading.Lock()
+        self._profiling_span = None
+
+    def configure(self, exporters: List, profile=(), profile_dir: str = ".", memory: bool = False):
+        """
+        Enable tracing.
+
+        Args:
+            exporters: objects with export(span) and close() methods
+            profile: span names to capture with cProfile (one .prof file per span);
+                     works without exporters
+            profile_dir: directory for .prof files
+            memory: record tracemalloc allocation deltas on every span (as a span
+                    attribute, so only visible through an exporter)
+        """
+        self.shutdown()
+        self.exporters = list(exporters)
+        self.profile = frozenset(profile)
+        self.profile_dir = profile_dir
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile and not os.path.exists(profile_dir):
+            os.makedirs(profile_dir)
+        self.enabled = bool(self.exporters or self.profile)
+
+    def shutdown(self):
+        """Flush and close all exporters, and turn tracing off."""
+        self.enabled = False
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def span(self, name: str, **attributes):
+        """Start a span to be used as a context manager; it becomes the current span."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes, _current_span.get())
+
+    def start_span(self, name: str, **attributes):
+        """Start a span that does not become current; call end() when done (e.g. across a stream)."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes, _current_span.get())
+
+    def _export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+tracer = Tracer()
+
+def span(name: str, **attributes):
+    """Start a span on the global tracer."""
+    return tracer.span(name, **attributes)
+
+def start_span(name: str, **attributes):
+    """Start a detached span on the global tracer."""
+    return tracer.start_span(name, **attributes)
+
+def current_span():
+    """Return the current span, or a no-op span when there is none."""
+    return _current_span.get() or _NOOP_SPAN
+
+def configure_from_env():
+    """
+    Configure the global tracer from environment variables:
+
+    EILEEN_TRACE_JSONL       path of a JSONL span log
+    EILEEN_TRACE_CHROME      path of a Chrome trace file
+    EILEEN_TRACE_PROFILE     comma-separated span names to cProfile (e.g. "novel,llm.call")
+    EILEEN_TRACE_PROFILE_DIR directory for .prof files (default: profiles)
+    EILEEN_TRACE_MEMORY      set to 1 to record tracemalloc deltas (needs an exporter)
+    """
+    exporters = []
+    if os.environ.get("EILEEN_TRACE_JSONL"):
+        exporters.append(JSONLExporter(os.environ["EILEEN_TRACE_JSONL"]))
+    if os.environ.get("EILEEN_TRACE_CHROME"):
+        exporters.append(ChromeTraceExporter(os.environ["EILEEN_TRACE_CHROME"]))
+    profile = [name for name in os.environ.get("EILEEN_TRACE_PROFILE", "").split(",") if name]
+    if not exporters and not profile:
+        if os.environ.get("EILEEN_TRACE_MEMORY") == "1":
+            print("EILEEN_TRACE_MEMORY ignored: set EILEEN_TRACE_JSONL or EILEEN_TRACE_CHROME to see it")
+        return
+
+    tracer.configure(
+        exporters,
+        profile=profile,
+        profile_dir=os.environ.get("EILEEN_TRACE_PROFILE_DIR", "profiles"),
+        memory=os.environ.get("EILEEN_TRACE_MEMORY") == "1",
+    )